@@ -1,13 +1,98 @@
+import orjson
 import requests
+import requests_cache
 import datetime
+import operator
 import sys
-from dateutil import parser
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+def parse_esi_time(timestamp):
+    """Parse an ESI ISO-8601 timestamp such as 2023-01-05T12:00:00Z."""
+    return datetime.datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
 
-class EveOnlineAPI:
+
+class ShipInfoCache:
+    """Ship type info keyed by ship_type_id, shared by every client in the process.
+
+    Ship types are static and not character-specific, so one lookup per type
+    is enough no matter which character or client asks.
+    """
+
+    def __init__(self):
+        self._info = {}
+
+    @staticmethod
+    def endpoint(ship_type_id):
+        """ESI endpoint that describes a ship type."""
+        return f"/universe/types/{ship_type_id}/"
+
+    def get(self, ship_type_id):
+        """Return cached info for a ship type, or None if not fetched yet."""
+        return self._info.get(ship_type_id)
+
+    def store(self, ship_type_id, info):
+        """Remember info for a ship type and return it."""
+        self._info[ship_type_id] = info
+        return info
+
+    def clear(self):
+        """Forget every cached ship type."""
+        self._info.clear()
+
+
+ship_info_cache = ShipInfoCache()
+
+
+class LossReportMixin:
+    """Loss selection and formatting shared by the sync and asyncio clients."""
+
+    def find_most_recent_loss(self, losses):
+        """Find the most recent ship loss from a list of losses."""
+        if not losses:
+            return None
+        # ESI timestamps are fixed-width UTC, so they sort chronologically as strings
+        return max(losses, key=operator.itemgetter('killmail_time'))
+
+    def format_time_difference(self, time_diff):
+        """Format a time difference into a human-readable string."""
+        days = time_diff.days
+        hours, remainder = divmod(time_diff.seconds, 3600)
+        minutes, seconds = divmod(remainder, 60)
+
+        # Zero fields are skipped, but seconds are always shown
+        fields = (
+            (days, "day"),
+            (hours, "hour"),
+            (minutes, "minute"),
+            (seconds, "second")
+        )
+        parts = [
+            f"{value} {name}{'s' if value != 1 else ''}"
+            for value, name in fields
+            if value > 0 or name == "second"
+        ]
+        return "Time since last ship loss: " + ", ".join(parts)
+
+
+class EveOnlineAPI(LossReportMixin):
     """Class to handle EVE Online API interactions and ship loss tracking."""
 
     BASE_URL = "https://esi.evetech.net/latest"
+    ZKB_URL = "https://zkillboard.com/api"
+    # zKillboard asks API clients to identify themselves
+    ZKB_USER_AGENT = "EveLastLoss (https://github.com/TargetedEntropy/EveLastLoss)"
+    # (connect, read) timeouts in seconds
+    REQUEST_TIMEOUT = (3.05, 30)
+    # Concurrent killmail detail fetches; matches the connection pool size
+    MAX_WORKERS = 16
+    # Killmail details fetched per batch while searching for the latest loss
+    LOSS_BATCH_SIZE = 8
+    # Responses are cached on disk for as long as ESI's cache headers allow
+    CACHE_NAME = "eve_last_loss"
+    CACHE_BACKEND = "sqlite"
+    CACHE_EXPIRE_AFTER = 3600
 
     def __init__(self, access_token, character_id):
         """Initialize with authentication and character information."""
@@ -15,17 +100,55 @@ class EveOnlineAPI:
         self.character_id = int(character_id)
         self.headers = {
             "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate"
         }
 
+        # Reuse one session so connections to ESI are kept alive between calls,
+        # and keep responses on disk so repeated runs skip immutable lookups
+        self.session = requests_cache.CachedSession(
+            self.CACHE_NAME,
+            backend=self.CACHE_BACKEND,
+            use_cache_dir=True,
+            cache_control=True,
+            expire_after=self.CACHE_EXPIRE_AFTER,
+            allowable_codes=(200,)
+        )
+        self.session.headers.update(self.headers)
+        retries = Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[429, 500, 502, 503, 504]
+        )
+        adapter = HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=self.MAX_WORKERS,
+            max_retries=retries
+        )
+        self.session.mount("https://", adapter)
+
+        self.executor = ThreadPoolExecutor(max_workers=self.MAX_WORKERS)
+
+    def close(self):
+        """Release the underlying HTTP session and worker threads."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def _make_request(self, endpoint, params=None):
         """Make a request to the EVE ESI API and handle errors."""
         try:
             url = f"{self.BASE_URL}{endpoint}"
-            response = requests.get(url, headers=self.headers, params=params)
+            response = self.session.get(
+                url, params=params, timeout=self.REQUEST_TIMEOUT)
             response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
+            return orjson.loads(response.content)
+        except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
             raise Exception(f"Error accessing EVE Online API: {str(e)}")
 
     def get_recent_killmails(self):
@@ -40,57 +163,91 @@ class EveOnlineAPI:
 
     def get_ship_info(self, ship_type_id):
         """Get information about a ship type."""
-        endpoint = f"/universe/types/{ship_type_id}/"
-        return self._make_request(endpoint)
+        info = ship_info_cache.get(ship_type_id)
+        if info is None:
+            endpoint = ship_info_cache.endpoint(ship_type_id)
+            info = ship_info_cache.store(ship_type_id, self._make_request(endpoint))
+        return info
 
-    def filter_character_losses(self, killmails):
-        """Filter killmails to only include those where the character was the victim."""
-        losses = []
-        for kill in killmails:
-            kill_detail = self.get_killmail_details(
-                kill['killmail_id'],
-                kill['killmail_hash']
+    def get_character_losses_from_zkb(self):
+        """Retrieve the character's losses from zKillboard."""
+        url = f"{self.ZKB_URL}/losses/characterID/{self.character_id}/"
+        # Never forward the ESI bearer token to a third party
+        headers = {"Authorization": None, "User-Agent": self.ZKB_USER_AGENT}
+        try:
+            # Only cache if zKB says so; the fallback expiry could hide a new loss
+            response = self.session.get(
+                url,
+                headers=headers,
+                timeout=self.REQUEST_TIMEOUT,
+                expire_after=requests_cache.DO_NOT_CACHE
             )
-            if kill_detail['victim']['character_id'] == self.character_id:
-                losses.append(kill_detail)
-        return losses
+            response.raise_for_status()
+            return orjson.loads(response.content)
+        except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+            raise Exception(f"Error accessing zKillboard API: {str(e)}")
 
-    def find_most_recent_loss(self, losses):
-        """Find the most recent ship loss from a list of losses."""
-        if not losses:
-            return None
-        return max(losses, key=lambda x: parser.parse(x['killmail_time']))
+    def find_latest_loss(self, killmails):
+        """Find the character's most recent loss, checking the newest killmails first."""
+        # Killmail IDs increase over time, so sorting by ID is newest-first
+        killmails = sorted(
+            killmails, key=operator.itemgetter('killmail_id'), reverse=True)
+        for start in range(0, len(killmails), self.LOSS_BATCH_SIZE):
+            batch = killmails[start:start + self.LOSS_BATCH_SIZE]
+            details = self.executor.map(
+                lambda kill: self.get_killmail_details(
+                    kill['killmail_id'],
+                    kill['killmail_hash']
+                ),
+                batch
+            )
+            # map preserves order, so the first match is the latest loss
+            for kill_detail in details:
+                if kill_detail['victim']['character_id'] == self.character_id:
+                    return kill_detail
+        return None
 
-    def format_time_difference(self, time_diff):
-        """Format a time difference into a human-readable string."""
-        days = time_diff.days
-        hours, remainder = divmod(time_diff.seconds, 3600)
-        minutes, seconds = divmod(remainder, 60)
+    def get_most_recent_loss(self):
+        """Get the details of the character's most recent loss, if any."""
+        # zKillboard lists only losses, so one ESI lookup is enough
+        try:
+            zkb_losses = self.get_character_losses_from_zkb()
+        except Exception:
+            zkb_losses = None
+        killmails = self.get_recent_killmails()
+
+        # zKB can answer 200 with an error object; only a list is usable
+        if not isinstance(zkb_losses, list):
+            return self.find_latest_loss(killmails)
 
-        result = "Time since last ship loss: "
-        if days > 0:
-            result += f"{days} day{'s' if days != 1 else ''}, "
-        if hours > 0:
-            result += f"{hours} hour{'s' if hours != 1 else ''}, "
-        if minutes > 0:
-            result += f"{minutes} minute{'s' if minutes != 1 else ''}, "
-        result += f"{seconds} second{'s' if seconds != 1 else ''}"
+        latest = None
+        if zkb_losses:
+            latest = max(zkb_losses, key=operator.itemgetter('killmail_id'))
 
-        return result
+        # ESI may know killmails zKB has not indexed yet; only those need
+        # checking, and the zKB result stands if none of them is a loss
+        newer = [
+            kill for kill in killmails
+            if latest is None or kill['killmail_id'] > latest['killmail_id']
+        ]
+        loss = self.find_latest_loss(newer)
+        if loss is not None or latest is None:
+            return loss
+        return self.get_killmail_details(
+            latest['killmail_id'],
+            latest['zkb']['hash']
+        )
 
     def get_time_since_last_ship_loss(self):
         """Calculate and format the time since the character's last ship loss."""
         try:
-            # Get killmail history and filter for losses
-            killmails = self.get_recent_killmails()
-            losses = self.filter_character_losses(killmails)
+            # Get the most recent loss and its details
+            most_recent_loss = self.get_most_recent_loss()
 
-            if not losses:
+            if most_recent_loss is None:
                 return "No ship losses found for this character."
 
-            # Get the most recent loss and its details
-            most_recent_loss = self.find_most_recent_loss(losses)
-            loss_time = parser.parse(most_recent_loss['killmail_time'])
+            loss_time = parse_esi_time(most_recent_loss['killmail_time'])
 
             # Calculate time difference
             now = datetime.datetime.now(datetime.timezone.utc)
@@ -124,8 +281,8 @@ def main():
     access_token = sys.argv[1]
     character_id = sys.argv[2]
 
-    eve_api = EveOnlineAPI(access_token, character_id)
-    result = eve_api.get_time_since_last_ship_loss()
+    with EveOnlineAPI(access_token, character_id) as eve_api:
+        result = eve_api.get_time_since_last_ship_loss()
     print(result)
 
 
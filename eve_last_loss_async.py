@@ -0,0 +1,191 @@
+import aiohttp
+import asyncio
+import datetime
+import json
+import orjson
+import os
+import sys
+import tempfile
+
+from eve_last_loss import (
+    EveOnlineAPI, LossReportMixin, parse_esi_time, ship_info_cache
+)
+
+
+class AsyncEveOnlineAPI(LossReportMixin):
+    """Asyncio variant of EveOnlineAPI that issues ESI calls concurrently."""
+
+    BASE_URL = EveOnlineAPI.BASE_URL
+    REQUEST_TIMEOUT = aiohttp.ClientTimeout(sock_connect=3.05, total=30)
+    # Bodies and ETags kept between runs for conditional requests
+    CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "eve_last_loss")
+
+    def __init__(self, access_token, character_id):
+        """Initialize with authentication and character information."""
+        self.access_token = access_token
+        self.character_id = int(character_id)
+        self.headers = {
+            "Authorization": f"Bearer {access_token}",
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate"
+        }
+        self.session = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            headers=self.headers,
+            timeout=self.REQUEST_TIMEOUT,
+            connector=aiohttp.TCPConnector(limit=20, keepalive_timeout=30)
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        """Release the underlying HTTP session."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _load_cached_response(self, etag_key):
+        """Load a previously stored ETag and body, if there is one."""
+        path = os.path.join(self.CACHE_DIR, f"{etag_key}.json")
+        try:
+            with open(path) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Treat files from a partial write or an older format as a miss
+        if not isinstance(cached, dict) or not {'etag', 'body'} <= cached.keys():
+            return None
+        return cached
+
+    def _store_cached_response(self, etag_key, etag, body):
+        """Store an ETag and body for the next conditional request."""
+        os.makedirs(self.CACHE_DIR, exist_ok=True)
+        path = os.path.join(self.CACHE_DIR, f"{etag_key}.json")
+        # Write a temp file and swap it in so a crash never leaves half a file
+        fd, tmp_path = tempfile.mkstemp(dir=self.CACHE_DIR, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'etag': etag, 'body': body}, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    async def _make_request(self, endpoint, params=None, etag_key=None):
+        """Make a request to the EVE ESI API and handle errors.
+
+        When etag_key is given, the last ETag is sent as If-None-Match and
+        the stored body is reused if ESI answers 304 Not Modified.
+        """
+        # Cache file I/O runs in a worker thread to keep the event loop free
+        cached = None
+        if etag_key:
+            cached = await asyncio.to_thread(self._load_cached_response, etag_key)
+        headers = {"If-None-Match": cached['etag']} if cached else None
+        try:
+            url = f"{self.BASE_URL}{endpoint}"
+            async with self.session.get(url, params=params, headers=headers) as response:
+                if cached and response.status == 304:
+                    return cached['body']
+                response.raise_for_status()
+                body = orjson.loads(await response.read())
+                etag = response.headers.get("ETag")
+                if etag_key and etag:
+                    await asyncio.to_thread(
+                        self._store_cached_response, etag_key, etag, body)
+                return body
+        except (aiohttp.ClientError, asyncio.TimeoutError, orjson.JSONDecodeError) as e:
+            raise Exception(f"Error accessing EVE Online API: {str(e)}")
+
+    async def get_recent_killmails(self):
+        """Retrieve recent killmails for the character."""
+        endpoint = f"/characters/{self.character_id}/killmails/recent/"
+        etag_key = f"recent_{self.character_id}"
+        return await self._make_request(endpoint, etag_key=etag_key)
+
+    async def get_killmail_details(self, kill_id, kill_hash):
+        """Get detailed information about a specific killmail."""
+        endpoint = f"/killmails/{kill_id}/{kill_hash}/"
+        return await self._make_request(endpoint)
+
+    async def get_ship_info(self, ship_type_id):
+        """Get information about a ship type."""
+        info = ship_info_cache.get(ship_type_id)
+        if info is None:
+            endpoint = ship_info_cache.endpoint(ship_type_id)
+            info = ship_info_cache.store(ship_type_id, await self._make_request(endpoint))
+        return info
+
+    async def filter_character_losses(self, killmails):
+        """Filter killmails to only include those where the character was the victim."""
+        details = await asyncio.gather(*[
+            self.get_killmail_details(kill['killmail_id'], kill['killmail_hash'])
+            for kill in killmails
+        ])
+        return [
+            kill_detail for kill_detail in details
+            if kill_detail['victim']['character_id'] == self.character_id
+        ]
+
+    async def get_time_since_last_ship_loss(self):
+        """Calculate and format the time since the character's last ship loss."""
+        try:
+            # Get killmail history and filter for losses
+            killmails = await self.get_recent_killmails()
+            losses = await self.filter_character_losses(killmails)
+
+            if not losses:
+                return "No ship losses found for this character."
+
+            # Get the most recent loss and its details
+            most_recent_loss = self.find_most_recent_loss(losses)
+            loss_time = parse_esi_time(most_recent_loss['killmail_time'])
+
+            # Calculate time difference
+            now = datetime.datetime.now(datetime.timezone.utc)
+            time_diff = now - loss_time
+
+            # Format the result
+            result = self.format_time_difference(time_diff)
+
+            # Add ship info if available
+            if 'ship_type_id' in most_recent_loss['victim']:
+                ship_type_id = most_recent_loss['victim']['ship_type_id']
+                try:
+                    ship_info = await self.get_ship_info(ship_type_id)
+                    result += f"\nLost ship: {ship_info['name']}"
+                except Exception:
+                    # If we can't get the ship info, just continue without it
+                    pass
+
+            return result
+
+        except Exception as e:
+            return f"An unexpected error occurred: {str(e)}"
+
+
+async def run(access_token, character_id):
+    """Open a session, look up the last loss and close the session again."""
+    async with AsyncEveOnlineAPI(access_token, character_id) as eve_api:
+        return await eve_api.get_time_since_last_ship_loss()
+
+
+def main():
+    """Main function to run the script from command line."""
+    if len(sys.argv) != 3:
+        print("Usage: python eve_last_loss_async.py <access_token> <character_id>")
+        sys.exit(1)
+
+    access_token = sys.argv[1]
+    character_id = sys.argv[2]
+
+    result = asyncio.run(run(access_token, character_id))
+    print(result)
+
+
+if __name__ == "__main__":
+    main()
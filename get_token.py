@@ -2,6 +2,7 @@ import requests
 import webbrowser
 import http.server
 import socketserver
+import threading
 import urllib.parse
 import json
 import base64
@@ -20,17 +21,6 @@ CLIENT_SECRET = os.getenv("EVE_CLIENT_SECRET")
 CALLBACK_URL = "http://localhost:8080/callback"
 SCOPES = "esi-killmails.read_killmails.v1"  # Scope needed for killmail access
 
-# Check if credentials are loaded
-if not CLIENT_ID or not CLIENT_SECRET:
-    print("Error: Missing credentials in .env file")
-    print("Please create a .env file with EVE_CLIENT_ID and EVE_CLIENT_SECRET")
-    exit(1)
-
-# Generate PKCE challenge (for enhanced security)
-code_verifier = secrets.token_urlsafe(64)
-code_challenge = base64.urlsafe_b64encode(hashlib.sha256(
-    code_verifier.encode()).digest()).decode().rstrip('=')
-
 # Server to capture the callback
 
 
@@ -48,7 +38,9 @@ class CallbackHandler(http.server.BaseHTTPRequestHandler):
                 self.wfile.write(
                     b"Authorization successful! You can close this window now.")
             else:
-                self.wfile.write(b"Authorization failed. Please try again.")
+                self.wfile.write(b"Authorization failed. Re-run get_token.py to try again.")
+            # Wake the main thread whether or not a code was granted
+            self.server.callback_received.set()
         else:
             self.wfile.write(b"Invalid callback path.")
 
@@ -57,11 +49,38 @@ class CallbackHandler(http.server.BaseHTTPRequestHandler):
         return
 
 
+class CallbackServer(socketserver.TCPServer):
+    # Let re-runs bind port 8080 again straight away
+    allow_reuse_address = True
+    # Block in handle_request until a connection arrives instead of polling
+    timeout = None
+
+    def handle_until_callback(self):
+        """Serve requests (e.g. favicon) until the OAuth callback arrives."""
+        while not self.callback_received.is_set():
+            self.handle_request()
+
+
 def get_access_token():
+    # Check if credentials are loaded
+    if not CLIENT_ID or not CLIENT_SECRET:
+        print("Error: Missing credentials in .env file")
+        print("Please create a .env file with EVE_CLIENT_ID and EVE_CLIENT_SECRET")
+        exit(1)
+
+    # Generate PKCE challenge (for enhanced security)
+    code_verifier = secrets.token_urlsafe(64)
+    code_challenge = base64.urlsafe_b64encode(hashlib.sha256(
+        code_verifier.encode('ascii'), usedforsecurity=True).digest()).decode().rstrip('=')
+
     # 1. Start the local server to catch the callback
-    httpd = socketserver.TCPServer(("", 8080), CallbackHandler)
+    httpd = CallbackServer(("", 8080), CallbackHandler)
     httpd.authorization_code = None
+    httpd.callback_received = threading.Event()
     print("Starting server at http://localhost:8080")
+    server_thread = threading.Thread(
+        target=httpd.handle_until_callback, daemon=True)
+    server_thread.start()
 
     # 2. Generate the authorization URL and open browser
     auth_url = (
@@ -81,10 +100,14 @@ def get_access_token():
 
     # 3. Wait for the callback
     print("Waiting for authorization...")
-    while httpd.authorization_code is None:
-        httpd.handle_request()
+    httpd.callback_received.wait()
+    server_thread.join()
+    httpd.server_close()
 
     authorization_code = httpd.authorization_code
+    if authorization_code is None:
+        print("Authorization was denied or failed.")
+        return None, None
     print("Authorization code received!")
 
     # 4. Exchange the authorization code for an access token
@@ -1,20 +1,33 @@
 import pytest
 import datetime
+import orjson
+import io
+import requests_cache
+import urllib3
+from requests.adapters import HTTPAdapter
 from unittest.mock import patch, MagicMock
-from dateutil import parser
 
 # Import your class - adjust the import path as needed
-from eve_last_loss import EveOnlineAPI
+from eve_last_loss import EveOnlineAPI, parse_esi_time, ship_info_cache
+
+
+@pytest.fixture(autouse=True)
+def memory_cache():
+    """Keep the HTTP cache in memory so tests never touch the user's cache dir."""
+    with patch.object(EveOnlineAPI, 'CACHE_BACKEND', 'memory'):
+        yield
 
 
 @pytest.fixture
-def mock_api():
+def mock_api(memory_cache):
     """Create a mock EveOnlineAPI instance with test data."""
-    with patch('eve_last_loss.requests.get') as mock_get:
-        api = EveOnlineAPI('fake_token', '12345')
+    api = EveOnlineAPI('fake_token', '12345')
+    ship_info_cache.clear()
+    with patch.object(api.session, 'get') as mock_get:
         # Add the mock_get to the api so tests can configure it
         api.mock_get = mock_get
         yield api
+    ship_info_cache.clear()
 
 
 class TestEveOnlineAPI:
@@ -27,14 +40,27 @@ class TestEveOnlineAPI:
         assert api.character_id == 12345
         assert api.headers == {
             "Authorization": "Bearer test_token",
-            "Content-Type": "application/json"
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate"
         }
+        assert api.session.headers["Authorization"] == "Bearer test_token"
+        assert isinstance(api.session, requests_cache.CachedSession)
+    
+    def test_close(self):
+        """Test that the context manager closes the session."""
+        with EveOnlineAPI('test_token', '12345') as api:
+            mock_close = MagicMock()
+            api.session.close = mock_close
+        
+        mock_close.assert_called_once()
+        with pytest.raises(RuntimeError):
+            api.executor.submit(print)
     
     def test_make_request_success(self, mock_api):
         """Test successful API requests."""
         # Setup mock response
         mock_response = MagicMock()
-        mock_response.json.return_value = {"data": "test_data"}
+        mock_response.content = orjson.dumps({"data": "test_data"})
         mock_api.mock_get.return_value = mock_response
         
         # Test the method
@@ -44,17 +70,26 @@ class TestEveOnlineAPI:
         assert result == {"data": "test_data"}
         mock_api.mock_get.assert_called_once_with(
             f"{EveOnlineAPI.BASE_URL}/test/endpoint", 
-            headers=mock_api.headers, 
-            params=None
+            params=None,
+            timeout=EveOnlineAPI.REQUEST_TIMEOUT
         )
     
+    def test_make_request_invalid_json(self, mock_api):
+        """Test that undecodable responses surface as API errors."""
+        mock_response = MagicMock()
+        mock_response.content = b"<html>"
+        mock_api.mock_get.return_value = mock_response
+        
+        with pytest.raises(Exception, match="Error accessing EVE Online API"):
+            mock_api._make_request('/test/endpoint')
+    
    
     def test_get_recent_killmails(self, mock_api):
         """Test retrieving recent killmails."""
         # Setup mock data
         mock_killmails = [{"killmail_id": 123, "killmail_hash": "abc123"}]
         mock_response = MagicMock()
-        mock_response.json.return_value = mock_killmails
+        mock_response.content = orjson.dumps(mock_killmails)
         mock_api.mock_get.return_value = mock_response
         
         # Test the method
@@ -64,8 +99,8 @@ class TestEveOnlineAPI:
         assert result == mock_killmails
         mock_api.mock_get.assert_called_once_with(
             f"{EveOnlineAPI.BASE_URL}/characters/12345/killmails/recent/",
-            headers=mock_api.headers,
-            params=None
+            params=None,
+            timeout=EveOnlineAPI.REQUEST_TIMEOUT
         )
     
     def test_get_killmail_details(self, mock_api):
@@ -75,7 +110,7 @@ class TestEveOnlineAPI:
         kill_hash = "abc123"
         mock_details = {"victim": {"character_id": 12345}}
         mock_response = MagicMock()
-        mock_response.json.return_value = mock_details
+        mock_response.content = orjson.dumps(mock_details)
         mock_api.mock_get.return_value = mock_response
         
         # Test the method
@@ -85,8 +120,8 @@ class TestEveOnlineAPI:
         assert result == mock_details
         mock_api.mock_get.assert_called_once_with(
             f"{EveOnlineAPI.BASE_URL}/killmails/{kill_id}/{kill_hash}/",
-            headers=mock_api.headers,
-            params=None
+            params=None,
+            timeout=EveOnlineAPI.REQUEST_TIMEOUT
         )
     
     def test_get_ship_info(self, mock_api):
@@ -95,41 +130,179 @@ class TestEveOnlineAPI:
         ship_type_id = 456
         mock_ship_info = {"name": "Test Ship"}
         mock_response = MagicMock()
-        mock_response.json.return_value = mock_ship_info
+        mock_response.content = orjson.dumps(mock_ship_info)
         mock_api.mock_get.return_value = mock_response
         
-        # Test the method
+        # Test the method; the second lookup is served from memory
         result = mock_api.get_ship_info(ship_type_id)
+        cached_result = mock_api.get_ship_info(ship_type_id)
         
         # Assertions
         assert result == mock_ship_info
+        assert cached_result == mock_ship_info
         mock_api.mock_get.assert_called_once_with(
             f"{EveOnlineAPI.BASE_URL}/universe/types/{ship_type_id}/",
-            headers=mock_api.headers,
-            params=None
+            params=None,
+            timeout=EveOnlineAPI.REQUEST_TIMEOUT
         )
     
-    def test_filter_character_losses(self, mock_api):
-        """Test filtering killmails for character losses."""
-        # Setup mock data and behavior for get_killmail_details
+    def test_get_character_losses_from_zkb(self, mock_api):
+        """Test retrieving losses from zKillboard without the ESI token."""
+        mock_losses = [{"killmail_id": 123, "zkb": {"hash": "abc123"}}]
+        mock_response = MagicMock()
+        mock_response.content = orjson.dumps(mock_losses)
+        mock_api.mock_get.return_value = mock_response
+        
+        result = mock_api.get_character_losses_from_zkb()
+        
+        assert result == mock_losses
+        mock_api.mock_get.assert_called_once_with(
+            f"{EveOnlineAPI.ZKB_URL}/losses/characterID/12345/",
+            headers={"Authorization": None, "User-Agent": EveOnlineAPI.ZKB_USER_AGENT},
+            timeout=EveOnlineAPI.REQUEST_TIMEOUT,
+            expire_after=requests_cache.DO_NOT_CACHE
+        )
+    
+    def test_get_character_losses_from_zkb_not_cached(self):
+        """Test that zKillboard replies without cache headers are refetched every time."""
+        api = EveOnlineAPI('test_token', '12345')
+        
+        def send(request, **kwargs):
+            # A zKB reply that carries no cache headers at all
+            raw = urllib3.HTTPResponse(
+                body=io.BytesIO(b"[]"), status=200, preload_content=False,
+                request_url=request.url)
+            return HTTPAdapter().build_response(request, raw)
+        
+        adapter = MagicMock(spec=HTTPAdapter)
+        adapter.send.side_effect = send
+        api.session.mount("https://", adapter)
+        
+        api.get_character_losses_from_zkb()
+        api.get_character_losses_from_zkb()
+        
+        assert adapter.send.call_count == 2
+    
+    def test_get_most_recent_loss_from_zkb(self, mock_api):
+        """Test that a zKillboard hit needs only one ESI detail lookup."""
+        zkb_losses = [
+            {"killmail_id": 123, "zkb": {"hash": "abc123"}},
+            {"killmail_id": 456, "zkb": {"hash": "def456"}}
+        ]
+        killmails = [
+            {"killmail_id": 123, "killmail_hash": "abc123"},
+            {"killmail_id": 456, "killmail_hash": "def456"}
+        ]
+        loss_detail = {"victim": {"character_id": 12345}}
+        
+        with patch.object(mock_api, 'get_character_losses_from_zkb', return_value=zkb_losses), \
+             patch.object(mock_api, 'get_recent_killmails', return_value=killmails), \
+             patch.object(mock_api, 'get_killmail_details', return_value=loss_detail) as mock_details:
+            result = mock_api.get_most_recent_loss()
+        
+        assert result == loss_detail
+        mock_details.assert_called_once_with(456, "def456")
+    
+    def test_get_most_recent_loss_esi_ahead_of_zkb(self, mock_api):
+        """Test that killmails zKillboard has not indexed yet are still checked."""
+        zkb_losses = [{"killmail_id": 123, "zkb": {"hash": "abc123"}}]
         killmails = [
             {"killmail_id": 123, "killmail_hash": "abc123"},
             {"killmail_id": 456, "killmail_hash": "def456"}
         ]
+        loss_detail = {"victim": {"character_id": 12345}}
+        
+        with patch.object(mock_api, 'get_character_losses_from_zkb', return_value=zkb_losses), \
+             patch.object(mock_api, 'get_recent_killmails', return_value=killmails), \
+             patch.object(mock_api, 'get_killmail_details', return_value=loss_detail) as mock_details:
+            result = mock_api.get_most_recent_loss()
+        
+        assert result == loss_detail
+        mock_details.assert_called_once_with(456, "def456")
+    
+    def test_get_most_recent_loss_zkb_empty(self, mock_api):
+        """Test that an empty zKillboard reply needs no detail lookups when ESI agrees."""
+        with patch.object(mock_api, 'get_character_losses_from_zkb', return_value=[]), \
+             patch.object(mock_api, 'get_recent_killmails', return_value=[]), \
+             patch.object(mock_api, 'get_killmail_details') as mock_details:
+            result = mock_api.get_most_recent_loss()
+        
+        assert result is None
+        mock_details.assert_not_called()
+    
+    def test_get_most_recent_loss_zkb_error_object(self, mock_api):
+        """Test falling back to ESI when zKillboard answers with an error object."""
+        killmails = [{"killmail_id": 123, "killmail_hash": "abc123"}]
+        loss_detail = {"victim": {"character_id": 12345}}
+        
+        with patch.object(mock_api, 'get_character_losses_from_zkb', return_value={"error": "rate limited"}), \
+             patch.object(mock_api, 'get_recent_killmails', return_value=killmails), \
+             patch.object(mock_api, 'find_latest_loss', return_value=loss_detail) as mock_find:
+            result = mock_api.get_most_recent_loss()
+        
+        assert result == loss_detail
+        mock_find.assert_called_once_with(killmails)
+    
+    def test_get_most_recent_loss_zkb_unreachable(self, mock_api):
+        """Test falling back to ESI when zKillboard fails."""
+        loss_detail = {"victim": {"character_id": 12345}, "killmail_time": "2023-01-05T12:00:00Z"}
+        
+        with patch.object(mock_api, 'get_character_losses_from_zkb', side_effect=Exception("down")), \
+             patch.object(mock_api, 'get_recent_killmails', return_value=[{}]), \
+             patch.object(mock_api, 'find_latest_loss', return_value=loss_detail):
+            result = mock_api.get_most_recent_loss()
+        
+        assert result == loss_detail
+    
+    def test_find_latest_loss(self, mock_api):
+        """Test finding the latest loss among killmails."""
+        # Setup mock data and behavior for get_killmail_details
+        killmails = [
+            {"killmail_id": 123, "killmail_hash": "abc123"},
+            {"killmail_id": 456, "killmail_hash": "def456"},
+            {"killmail_id": 789, "killmail_hash": "ghi789"}
+        ]
         
         def mock_get_details(kill_id, kill_hash):
-            if kill_id == 123:
-                return {"victim": {"character_id": 12345}}  # This is our character
-            else:
-                return {"victim": {"character_id": 67890}}  # This is someone else
+            if kill_id == 789:
+                return {"killmail_id": kill_id, "victim": {"character_id": 67890}}  # Someone else
+            return {"killmail_id": kill_id, "victim": {"character_id": 12345}}  # Our character
         
         # Use patch to mock the get_killmail_details method
         with patch.object(mock_api, 'get_killmail_details', side_effect=mock_get_details):
-            result = mock_api.filter_character_losses(killmails)
+            result = mock_api.find_latest_loss(killmails)
         
         # Assertions
-        assert len(result) == 1
-        assert result[0]["victim"]["character_id"] == 12345
+        assert result["killmail_id"] == 456
+    
+    def test_find_latest_loss_stops_early(self, mock_api):
+        """Test that later batches are not fetched once a loss is found."""
+        killmails = [
+            {"killmail_id": kill_id, "killmail_hash": f"hash{kill_id}"}
+            for kill_id in range(EveOnlineAPI.LOSS_BATCH_SIZE * 3)
+        ]
+        loss_detail = {"victim": {"character_id": 12345}}
+        
+        with patch.object(mock_api, 'get_killmail_details', return_value=loss_detail) as mock_details:
+            result = mock_api.find_latest_loss(killmails)
+        
+        assert result == loss_detail
+        # Pending lookups in the first batch may be cancelled, so only bound the count
+        assert mock_details.call_count <= EveOnlineAPI.LOSS_BATCH_SIZE
+        # Killmails are searched newest-first, so only the highest IDs form the first batch
+        first_batch_start = EveOnlineAPI.LOSS_BATCH_SIZE * 2
+        requested_ids = [call.args[0] for call in mock_details.call_args_list]
+        assert all(kill_id >= first_batch_start for kill_id in requested_ids)
+    
+    def test_find_latest_loss_none(self, mock_api):
+        """Test that no loss is returned when the character was never the victim."""
+        killmails = [{"killmail_id": 123, "killmail_hash": "abc123"}]
+        
+        with patch.object(mock_api, 'get_killmail_details',
+                          return_value={"victim": {"character_id": 67890}}):
+            result = mock_api.find_latest_loss(killmails)
+        
+        assert result is None
     
     def test_find_most_recent_loss_empty(self):
         """Test finding most recent loss with empty list."""
@@ -151,6 +324,11 @@ class TestEveOnlineAPI:
         result = api.find_most_recent_loss(losses)
         assert result == newest_loss
     
+    def testparse_esi_time(self):
+        """Test parsing ESI timestamps into aware UTC datetimes."""
+        result = parse_esi_time("2023-01-05T12:00:00Z")
+        assert result == datetime.datetime(2023, 1, 5, 12, 0, 0, tzinfo=datetime.timezone.utc)
+    
     def test_format_time_difference(self):
         """Test formatting time difference."""
         api = EveOnlineAPI('test_token', '12345')
@@ -165,12 +343,23 @@ class TestEveOnlineAPI:
         assert "45 minutes" in result
         assert "30 seconds" in result
     
+    def test_format_time_difference_singular_and_zero_fields(self):
+        """Test singular units and skipped zero fields."""
+        api = EveOnlineAPI('test_token', '12345')
+        
+        time_diff = datetime.timedelta(days=1, minutes=1)
+        
+        result = api.format_time_difference(time_diff)
+        
+        assert result == "Time since last ship loss: 1 day, 1 minute, 0 seconds"
+    
     @patch('eve_last_loss.datetime')
     def test_get_time_since_last_ship_loss_success(self, mock_datetime, mock_api):
         """Test the full flow of getting time since last ship loss."""
         # Setup current time
         mock_now = datetime.datetime(2023, 1, 10, 12, 0, 0, tzinfo=datetime.timezone.utc)
         mock_datetime.datetime.now.return_value = mock_now
+        mock_datetime.datetime.fromisoformat = datetime.datetime.fromisoformat
         
         # Setup mock data for various method calls
         killmails = [{"killmail_id": 123, "killmail_hash": "abc123"}]
@@ -187,9 +376,9 @@ class TestEveOnlineAPI:
         ship_info = {"name": "Test Ship"}
         
         # Mock the methods that would make API calls
-        with patch.object(mock_api, 'get_recent_killmails', return_value=killmails), \
-             patch.object(mock_api, 'filter_character_losses', return_value=[loss_detail]), \
-             patch.object(mock_api, 'find_most_recent_loss', return_value=loss_detail), \
+        with patch.object(mock_api, 'get_character_losses_from_zkb', side_effect=Exception("zKB down")), \
+             patch.object(mock_api, 'get_recent_killmails', return_value=killmails), \
+             patch.object(mock_api, 'find_latest_loss', return_value=loss_detail), \
              patch.object(mock_api, 'get_ship_info', return_value=ship_info):
             
             result = mock_api.get_time_since_last_ship_loss()
@@ -202,8 +391,9 @@ class TestEveOnlineAPI:
     def test_get_time_since_last_ship_loss_no_losses(self, mock_api):
         """Test handling no ship losses found."""
         # Mock the methods to return no losses
-        with patch.object(mock_api, 'get_recent_killmails', return_value=[]), \
-             patch.object(mock_api, 'filter_character_losses', return_value=[]):
+        with patch.object(mock_api, 'get_character_losses_from_zkb', return_value=[]), \
+             patch.object(mock_api, 'get_recent_killmails', return_value=[]), \
+             patch.object(mock_api, 'find_latest_loss', return_value=None):
             
             result = mock_api.get_time_since_last_ship_loss()
         
@@ -213,7 +403,8 @@ class TestEveOnlineAPI:
     def test_get_time_since_last_ship_loss_error(self, mock_api):
         """Test handling unexpected errors."""
         # Mock the first method to raise an exception
-        with patch.object(mock_api, 'get_recent_killmails', side_effect=Exception("Test error")):
+        with patch.object(mock_api, 'get_character_losses_from_zkb', side_effect=Exception("zKB down")), \
+             patch.object(mock_api, 'get_recent_killmails', side_effect=Exception("Test error")):
             result = mock_api.get_time_since_last_ship_loss()
         
         # Assertions
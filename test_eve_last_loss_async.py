@@ -0,0 +1,149 @@
+import asyncio
+import datetime
+import orjson
+import pytest
+from unittest.mock import patch, AsyncMock, MagicMock
+
+from eve_last_loss import ship_info_cache
+from eve_last_loss_async import AsyncEveOnlineAPI
+
+
+class TestAsyncEveOnlineAPI:
+
+    def test_initialization(self):
+        """Test that the async API class initializes correctly."""
+        api = AsyncEveOnlineAPI('test_token', '12345')
+
+        assert api.access_token == 'test_token'
+        assert api.character_id == 12345
+        assert api.session is None
+
+    def test_session_lifecycle(self):
+        """Test that the context manager opens and closes the session."""
+        async def scenario():
+            async with AsyncEveOnlineAPI('test_token', '12345') as api:
+                session = api.session
+                assert session is not None
+                assert session.headers["Authorization"] == "Bearer test_token"
+            return api, session
+
+        api, session = asyncio.run(scenario())
+        assert api.session is None
+        assert session.closed
+
+    def test_recent_killmails_not_modified(self, tmp_path):
+        """Test that a 304 response reuses the stored killmail list."""
+        api = AsyncEveOnlineAPI('test_token', '12345')
+        api.CACHE_DIR = str(tmp_path)
+        killmails = [{"killmail_id": 123, "killmail_hash": "abc123"}]
+
+        fresh = MagicMock(status=200, headers={"ETag": '"v1"'})
+        fresh.read = AsyncMock(return_value=orjson.dumps(killmails))
+        not_modified = MagicMock(status=304, headers={})
+        api.session = MagicMock()
+        api.session.get.return_value.__aenter__.side_effect = [fresh, not_modified]
+
+        first = asyncio.run(api.get_recent_killmails())
+        second = asyncio.run(api.get_recent_killmails())
+
+        assert first == killmails
+        assert second == killmails
+        not_modified.raise_for_status.assert_not_called()
+        assert api.session.get.call_args_list[0].kwargs['headers'] is None
+        assert api.session.get.call_args_list[1].kwargs['headers'] == {"If-None-Match": '"v1"'}
+
+    def test_recent_killmails_incomplete_cache_file(self, tmp_path):
+        """Test that a cache file without an ETag or body is treated as a miss."""
+        api = AsyncEveOnlineAPI('test_token', '12345')
+        api.CACHE_DIR = str(tmp_path)
+        (tmp_path / "recent_12345.json").write_text('{"etag": "\\"v1\\""}')
+        killmails = [{"killmail_id": 123, "killmail_hash": "abc123"}]
+
+        fresh = MagicMock(status=200, headers={"ETag": '"v2"'})
+        fresh.read = AsyncMock(return_value=orjson.dumps(killmails))
+        api.session = MagicMock()
+        api.session.get.return_value.__aenter__.return_value = fresh
+
+        result = asyncio.run(api.get_recent_killmails())
+
+        assert result == killmails
+        assert api.session.get.call_args.kwargs['headers'] is None
+        assert api._load_cached_response("recent_12345") == {'etag': '"v2"', 'body': killmails}
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["recent_12345.json"]
+
+    def test_make_request_invalid_json(self):
+        """Test that undecodable responses surface as API errors."""
+        api = AsyncEveOnlineAPI('test_token', '12345')
+        response = MagicMock(status=200, headers={})
+        response.read = AsyncMock(return_value=b"<html>")
+        api.session = MagicMock()
+        api.session.get.return_value.__aenter__.return_value = response
+
+        with pytest.raises(Exception, match="Error accessing EVE Online API"):
+            asyncio.run(api._make_request('/test/endpoint'))
+
+    def test_get_ship_info_uses_shared_cache(self):
+        """Test that ship info cached by any client skips the ESI request."""
+        api = AsyncEveOnlineAPI('test_token', '12345')
+        ship_info_cache.clear()
+        ship_info_cache.store(456, {"name": "Test Ship"})
+
+        with patch.object(api, '_make_request', AsyncMock()) as mock_request:
+            result = asyncio.run(api.get_ship_info(456))
+        ship_info_cache.clear()
+
+        assert result == {"name": "Test Ship"}
+        mock_request.assert_not_called()
+
+    def test_filter_character_losses(self):
+        """Test filtering killmails for character losses."""
+        api = AsyncEveOnlineAPI('test_token', '12345')
+        killmails = [
+            {"killmail_id": 123, "killmail_hash": "abc123"},
+            {"killmail_id": 456, "killmail_hash": "def456"}
+        ]
+
+        async def mock_get_details(kill_id, kill_hash):
+            if kill_id == 123:
+                return {"victim": {"character_id": 12345}}  # This is our character
+            else:
+                return {"victim": {"character_id": 67890}}  # This is someone else
+
+        with patch.object(api, 'get_killmail_details', side_effect=mock_get_details):
+            result = asyncio.run(api.filter_character_losses(killmails))
+
+        assert len(result) == 1
+        assert result[0]["victim"]["character_id"] == 12345
+
+    @patch('eve_last_loss_async.datetime')
+    def test_get_time_since_last_ship_loss_success(self, mock_datetime):
+        """Test the full flow of getting time since last ship loss."""
+        mock_now = datetime.datetime(2023, 1, 10, 12, 0, 0, tzinfo=datetime.timezone.utc)
+        mock_datetime.datetime.now.return_value = mock_now
+
+        api = AsyncEveOnlineAPI('test_token', '12345')
+        loss_detail = {
+            "victim": {
+                "character_id": 12345,
+                "ship_type_id": 456
+            },
+            "killmail_time": "2023-01-05T12:00:00Z"
+        }
+
+        with patch.object(api, 'get_recent_killmails', AsyncMock(return_value=[{}])), \
+             patch.object(api, 'filter_character_losses', AsyncMock(return_value=[loss_detail])), \
+             patch.object(api, 'get_ship_info', AsyncMock(return_value={"name": "Test Ship"})):
+
+            result = asyncio.run(api.get_time_since_last_ship_loss())
+
+        assert "5 days" in result
+        assert "Lost ship: Test Ship" in result
+
+    def test_get_time_since_last_ship_loss_error(self):
+        """Test handling unexpected errors."""
+        api = AsyncEveOnlineAPI('test_token', '12345')
+
+        with patch.object(api, 'get_recent_killmails', AsyncMock(side_effect=Exception("Test error"))):
+            result = asyncio.run(api.get_time_since_last_ship_loss())
+
+        assert "An unexpected error occurred: Test error" in result